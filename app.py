@@ -1,11 +1,16 @@
 import streamlit as st
-from src.document_loader import DocumentProcessor
-from src.embeddings import VectorStoreManager
-from src.rag_pipeline import RAGPipeline
+from src.embeddings import VectorStoreNotFoundError
+from src.rag_pipeline import get_pipeline
+import logging
 import os
+import traceback
 from dotenv import load_dotenv
 load_dotenv()
 
+# Pipeline debug output is only emitted when LOGLEVEL=DEBUG
+logging.basicConfig(level=os.getenv("LOGLEVEL", "WARNING").upper())
+logger = logging.getLogger(__name__)
+
 if not os.getenv("OPENAI_API_KEY"):
     raise EnvironmentError("Please set OPENAI_API_KEY or provide in .env file")
 st.set_page_config(
@@ -28,10 +33,6 @@ if 'rag_pipeline' not in st.session_state:
 if 'is_initialized' not in st.session_state:
     st.session_state.is_initialized = False
 
-# vector_store: holds the vector database containing embedded documents
-if 'vector_store' not in st.session_state:
-    st.session_state.vector_store = None
-
 with st.sidebar:
     st.title("🧬 Oocyte Expert")
     st.markdown("### About\nThis AI assistant specializes in oocyte maturation research.")
@@ -47,23 +48,18 @@ with st.sidebar:
 
 st.title("Oocyte Research Assistant")
 
-# Initialize 
-try:
-    vector_db_path = "data/chroma_db"  
-    vector_store_manager = VectorStoreManager()
-    vector_store = vector_store_manager.load_vector_store(vector_db_path)
-    st.session_state.vector_store = vector_store
-except ValueError as e:
-    st.error(f"Vector store not found. Error: {str(e)}")
-    st.stop()
-
 # Initialize RAGPipeline
 if not st.session_state.is_initialized:
     with st.spinner("Initializing knowledge base..."):
         try:
-            st.session_state.rag_pipeline = RAGPipeline("data/chroma_db")
+            # One pipeline per process, shared by every session and rerun
+            st.session_state.rag_pipeline = get_pipeline()
             st.session_state.is_initialized = True
+        except VectorStoreNotFoundError as e:
+            st.error(f"Vector store not found. Error: {str(e)}")
+            st.stop()
         except Exception as e:
+            logger.exception("Error initializing system: %s", e)
             st.error(f"Error initializing system: {str(e)}")
             st.stop()
 
@@ -84,67 +80,51 @@ if prompt := st.chat_input("Ask your question about oocyte research..."):
         if not st.session_state.rag_pipeline:
             st.error("System not initialized. Please wait...")
         else:
-            with st.spinner("Researching..."):
-                try:
-                    # Get response from RAG pipeline
-                    response = st.session_state.rag_pipeline.ask(prompt)
-                    
-                    # Debug information
-                    print(f"Response keys: {response.keys() if isinstance(response, dict) else 'Not a dict'}")
-                    
-                    # Extract answer and citations
-                    if isinstance(response, dict):
-                        answer_text = response.get("answer", "Could not generate an answer")
-                        
-                        # Try to get citations from different possible response formats
-                        if "formatted_citations" in response:
-                            formatted_citations = response["formatted_citations"]
-                        elif "source_documents" in response:
-                            # Format source documents into citations
-                            source_docs = response["source_documents"]
-                            formatted_citations = []
-                            for doc in source_docs:
-                                if hasattr(doc, 'metadata'):
-                                    source = doc.metadata.get('source', 'Unknown source')
-                                    paper_title = doc.metadata.get('paper_title', '')
-                                    page = doc.metadata.get('page', '')
-                                    
-                                    citation = f"**Source**: {source}"
-                                    if paper_title:
-                                        citation += f" | **Title**: {paper_title}"
-                                    if page:
-                                        citation += f" | **Page**: {page}"
-                                    
-                                    formatted_citations.append(citation)
+            try:
+                # Retrieve context, then stream the answer as it is generated
+                with st.spinner("Researching..."):
+                    response = st.session_state.rag_pipeline.ask_stream(prompt)
+                
+                # Display answer
+                answer_text = st.write_stream(response["answer_stream"])
+                
+                # The pipeline always returns formatted, de-duplicated citations
+                formatted_citations = response["formatted_citations"]
+                
+                # Update chat history with answer and citations
+                st.session_state.chat_history.append({
+                    "role": "assistant",
+                    "content": answer_text,
+                    "citations": formatted_citations
+                })
+                
+                # 修改：总是显示引用部分，即使是"No source documents found"
+                with st.expander("📚 References", expanded=False):
+                    for citation in formatted_citations:
+                        st.markdown(citation)
                             
-                            if not formatted_citations:
-                                formatted_citations = ["No source documents found"]
-                        else:
-                            formatted_citations = ["No source information available"]
-                    else:
-                        answer_text = str(response)
-                        formatted_citations = ["No source information available"]
-                    
-                    # Update chat history with answer and citations
-                    st.session_state.chat_history.append({
-                        "role": "assistant",
-                        "content": answer_text,
-                        "citations": formatted_citations
-                    })
-                    
-                    # Display answer
-                    st.write(answer_text)
-                    
-                    # 修改：总是显示引用部分，即使是"No source documents found"
-                    with st.expander("📚 References", expanded=False):
-                        for citation in formatted_citations:
-                            st.markdown(citation)
-                                
-                except Exception as e:
-                    st.error(f"Error generating response: {str(e)}")
-                    import traceback
+            except Exception as e:
+                logger.exception("Error generating response: %s", e)
+                st.error(f"Error generating response: {str(e)}")
+                # Full tracebacks only in the UI when debugging
+                if logger.isEnabledFor(logging.DEBUG):
                     st.error(traceback.format_exc())
 
+# Bounded, since the cache is shared by every session on the server
+@st.cache_data(max_entries=32, ttl=3600)
+def build_chat_export(history):
+    """Create a formatted markdown export from (role, content, citations) tuples"""
+    parts = ["# Oocyte Research Chat Export\n\n"]
+    for role, content, citations in history:
+        label = "🧑‍💼 User" if role == "user" else "🤖 Assistant"
+        parts.append(f"## {label}\n\n{content}\n\n")
+        # 修改：总是包含引用，即使是"No source documents found"
+        if role == "assistant" and citations:
+            parts.append("### References\n\n")
+            parts.extend(f"- {citation}\n" for citation in citations)
+            parts.append("\n---\n\n")
+    return "".join(parts)
+
 st.markdown("---")
 col1, col2 = st.columns(2)
 
@@ -155,17 +135,12 @@ with col1:
 
 with col2:
     if st.button("Export Chat"):
-        # Create a formatted chat export
-        chat_export = "# Oocyte Research Chat Export\n\n"
-        for msg in st.session_state.chat_history:
-            role = "🧑‍💼 User" if msg["role"] == "user" else "🤖 Assistant"
-            chat_export += f"## {role}\n\n{msg['content']}\n\n"
-            # 修改：总是包含引用，即使是"No source documents found"
-            if msg["role"] == "assistant" and "citations" in msg and msg["citations"]:
-                chat_export += "### References\n\n"
-                for citation in msg["citations"]:
-                    chat_export += f"- {citation}\n"
-                chat_export += "\n---\n\n"
+        # Hashable snapshot of the history so unchanged chats reuse the cached export
+        history = tuple(
+            (msg["role"], msg["content"], tuple(msg.get("citations") or ()))
+            for msg in st.session_state.chat_history
+        )
+        chat_export = build_chat_export(history)
         
         # Download button for the chat export
         st.download_button(
@@ -1,38 +1,58 @@
 from src.document_loader import DocumentProcessor
-from src.embeddings import VectorStoreManager
+from src.embeddings import DEFAULT_PERSIST_DIRECTORIES, VectorStoreManager
+import argparse
+import glob
+import hashlib
+import json
 import os
 import re
 
+# Records the SHA-256 of every PDF already in the vector store
+INGESTED_MANIFEST = "ingested.json"
+
+# 已知文献的元数据映射表 - 可以根据需要扩展
+KNOWN_PAPERS = {
+    # 使用文件名的一部分作为键，这样可以匹配不同目录下的相同文件
+    "s41598-018-27829-9": {
+        "paper_title": "Metabolomic profiles of bovine cumulus cells and cumulus-oocyte-complex-conditioned medium during maturation in vitro",
+        "authors": "Uhde et al.",
+        "journal": "Scientific Reports",
+        "year": "2018",
+        "volume": "8",
+        "pages": "9477",
+        "doi": "10.1038/s41598-018-27829-9"
+    },
+    # 可以添加更多已知论文
+}
+
+# 一次正则搜索匹配所有已知论文的键（较长的键优先）
+_KNOWN_PAPER_RE = re.compile(
+    '|'.join(re.escape(key) for key in sorted(KNOWN_PAPERS, key=len, reverse=True))
+) if KNOWN_PAPERS else None
+
+# 引用所需的基本元数据字段
+_CITATION_FIELDS = ('paper_title', 'authors', 'journal')
+
+# 文件名清理用的正则，只编译一次
+_UNDERSCORE_RE = re.compile(r'[_\-]')
+_WS_RE = re.compile(r'\s+')
+
 def enhance_document_metadata(documents):
     """为文档添加或增强元数据，确保所有文档都有足够的引用信息"""
     
-    # 已知文献的元数据映射表 - 可以根据需要扩展
-    known_papers = {
-        # 使用文件名的一部分作为键，这样可以匹配不同目录下的相同文件
-        "s41598-018-27829-9": {
-            "paper_title": "Metabolomic profiles of bovine cumulus cells and cumulus-oocyte-complex-conditioned medium during maturation in vitro",
-            "authors": "Uhde et al.",
-            "journal": "Scientific Reports",
-            "year": "2018",
-            "volume": "8",
-            "pages": "9477",
-            "doi": "10.1038/s41598-018-27829-9"
-        },
-        # 可以添加更多已知论文
-    }
-    
     for doc in documents:
+        # 元数据已经完整的文档无需处理
+        if all(doc.metadata.get(field) for field in _CITATION_FIELDS):
+            continue
+        
         source_file = doc.metadata.get('source', '').lower()
         
         # 尝试从已知论文中匹配
-        matched = False
-        for key, metadata in known_papers.items():
-            if key in source_file:
-                # 将已知元数据复制到文档元数据
-                for meta_key, meta_value in metadata.items():
-                    doc.metadata[meta_key] = meta_value
-                matched = True
-                break
+        match = _KNOWN_PAPER_RE.search(source_file) if _KNOWN_PAPER_RE else None
+        matched = match is not None
+        if matched:
+            # 将已知元数据复制到文档元数据
+            doc.metadata.update(KNOWN_PAPERS[match.group(0)])
         
         # 如果没有匹配到已知论文，确保至少有基本元数据
         if not matched or 'paper_title' not in doc.metadata or not doc.metadata['paper_title']:
@@ -40,8 +60,8 @@ def enhance_document_metadata(documents):
             base_filename = os.path.basename(source_file)
             name_without_ext = os.path.splitext(base_filename)[0]
             # 清理文件名，使其更像论文标题
-            clean_title = re.sub(r'[_\-]', ' ', name_without_ext).strip()
-            clean_title = re.sub(r'\s+', ' ', clean_title)  # 合并多个空格
+            clean_title = _UNDERSCORE_RE.sub(' ', name_without_ext).strip()
+            clean_title = _WS_RE.sub(' ', clean_title)  # 合并多个空格
             clean_title = clean_title.title()  # 首字母大写
             
             if 'paper_title' not in doc.metadata or not doc.metadata['paper_title']:
@@ -56,7 +76,37 @@ def enhance_document_metadata(documents):
     print("文档元数据增强完成")
     return documents
 
+def file_sha256(path):
+    """Hash a file's contents so re-runs can skip PDFs that are already indexed"""
+    with open(path, 'rb') as f:
+        if hasattr(hashlib, 'file_digest'):  # Python 3.11+
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+        digest = hashlib.sha256()
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+        return digest.hexdigest()
+
+def load_ingested_hashes(persist_directory):
+    """Load the {sha256: filename} manifest of already ingested PDFs"""
+    manifest_path = os.path.join(persist_directory, INGESTED_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_ingested_hashes(persist_directory, hashes):
+    """Write the {sha256: filename} manifest of ingested PDFs"""
+    with open(os.path.join(persist_directory, INGESTED_MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(hashes, f, indent=2, ensure_ascii=False)
+
 def main():
+    parser = argparse.ArgumentParser(description="Index the PDFs in data/papers")
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="delete the existing vector store and index every PDF again"
+    )
+    args = parser.parse_args()
+    
     pdf_directory = "data/papers"  
     
     # check if folder exist
@@ -66,24 +116,67 @@ def main():
         print(f"Please place your PDF files in {pdf_directory} directory and run this script again.")
         return
     
-    # check if PDFs in the folder
-    pdf_files = [f for f in os.listdir(pdf_directory) if f.lower().endswith('.pdf')]
+    # check if PDFs in the folder (including subfolders)
+    pdf_files = sorted(glob.glob(os.path.join(pdf_directory, "**", "*.pdf"), recursive=True))
     if not pdf_files:
         print(f"No PDF files found in {pdf_directory}!")
         print("Please add some PDF files to this directory and run this script again.")
         return
     
-    print(f"Found {len(pdf_files)} PDF files: {', '.join(pdf_files)}")
+    print(f"Found {len(pdf_files)} PDF files: {', '.join(os.path.relpath(f, pdf_directory) for f in pdf_files)}")
+    
+    try:
+        vector_store_manager = VectorStoreManager()
+    except Exception as e:
+        print(f"Error initializing vector store manager: {str(e)}")
+        print("Check your OpenAI API key and ensure it's correctly set in your .env file.")
+        return
+    
+    # skip PDFs whose contents are already in the vector store
+    persist_directory = DEFAULT_PERSIST_DIRECTORIES[vector_store_manager.backend]
+    if args.rebuild:
+        print("Deleting the existing vector store...")
+        vector_store_manager.reset_vector_store(persist_directory)
+        manifest_path = os.path.join(persist_directory, INGESTED_MANIFEST)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        ingested = {}
+    else:
+        ingested = load_ingested_hashes(persist_directory)
+        # without a manifest the new chunks would be added next to the old copies
+        if not ingested and vector_store_manager.count_vectors(persist_directory):
+            print(f"The vector store in {persist_directory} already has documents but no {INGESTED_MANIFEST}.")
+            print("Run this script with --rebuild to re-index every PDF from scratch.")
+            return
+    
+    new_files = {}
+    for pdf_path in pdf_files:
+        file_hash = file_sha256(pdf_path)
+        if file_hash not in ingested and file_hash not in new_files:
+            new_files[file_hash] = pdf_path
+    
+    if not new_files:
+        print("All PDF files are already in the vector store. Nothing to do.")
+        return
+    
+    print(f"{len(new_files)} new PDF files to process, {len(pdf_files) - len(new_files)} already indexed.")
     
     # load and process pdf
     print("Processing PDF documents...")
     document_processor = DocumentProcessor()
-    documents = document_processor.load_pdfs(pdf_directory)
+    documents = document_processor.load_pdfs_parallel(pdf_directory, pdf_paths=list(new_files.values()))
     
     if not documents:
         print("Error: No document chunks were generated!")
         return
     
+    # tag chunks with their file hash for later dedupe
+    hash_by_path = {pdf_path: file_hash for file_hash, pdf_path in new_files.items()}
+    for doc in documents:
+        file_hash = hash_by_path.get(doc.metadata.get('source'))
+        if file_hash:
+            doc.metadata['doc_hash'] = file_hash
+    
     # 增强文档元数据
     documents = enhance_document_metadata(documents)
     
@@ -106,8 +199,9 @@ def main():
     # create vector
     print("Creating vector store (this may take a while)...")
     try:
-        vector_store_manager = VectorStoreManager()
-        vector_store = vector_store_manager.create_vector_store(documents)
+        vector_store = vector_store_manager.create_vector_store(documents, persist_directory)
+        ingested.update({file_hash: os.path.relpath(pdf_path, pdf_directory) for file_hash, pdf_path in new_files.items()})
+        save_ingested_hashes(persist_directory, ingested)
         print("Vector store created successfully!")
         print("You can now run the Streamlit app and query your documents.")
     except Exception as e:
@@ -1,35 +1,319 @@
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.vectorstores import Chroma
+from langchain_openai import OpenAIEmbeddings
+from langchain.pydantic_v1 import PrivateAttr
+from langchain_community.vectorstores import Chroma
+from src.query_cache import QueryCache
 from dotenv import load_dotenv
+from openai import AsyncOpenAI
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_exponential
+from tqdm import tqdm
+from functools import lru_cache
+import asyncio
+import chromadb
+import hashlib
+import httpx
+import logging
+import numpy as np
+import openai
 import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Rate limits and transient server/network failures are worth retrying
+_RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.APITimeoutError,
+    openai.InternalServerError
+)
+
+# Default on-disk location for each supported vector store backend
+DEFAULT_PERSIST_DIRECTORIES = {
+    "chroma": "data/chroma_db",
+    "faiss": "data/faiss_index"
+}
+
+# LangChain's default collection name, used by the existing Chroma store
+CHROMA_COLLECTION_NAME = "langchain"
+
+# Chroma's settings for collections created without hnsw:* metadata
+CHROMA_HNSW_DEFAULTS = {
+    "hnsw:space": "l2",
+    "hnsw:construction_ef": 100,
+    "hnsw:M": 16,
+    "hnsw:search_ef": 10
+}
+
+# Connection pool shared by every OpenAI request a manager makes
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+HTTP_TIMEOUT = 30.0
+
+@lru_cache(maxsize=None)
+def _client(path):
+    """Return the process-wide Chroma client for a store path"""
+    return chromadb.PersistentClient(path=path)
+
+@lru_cache(maxsize=None)
+def _server_client(host, port):
+    """Return the process-wide client for a standalone Chroma server"""
+    return chromadb.HttpClient(host=host, port=port)
+
+def _chroma_client(persist_directory):
+    """Use the Chroma server named by CHROMA_HOST if set, else the embedded store"""
+    host = os.getenv("CHROMA_HOST")
+    if host:
+        return _server_client(host, int(os.getenv("CHROMA_PORT", "8000")))
+    return _client(os.path.abspath(persist_directory))
+
+class VectorStoreNotFoundError(ValueError):
+    """Raised when there is no vector store at the expected location"""
+
+class CachedEmbeddings(OpenAIEmbeddings):
+    """OpenAIEmbeddings that only sends texts it has not embedded before to the API"""
+
+    # Vectors are kept as float32 arrays (6 KB for 1536 dimensions instead of
+    # ~50 KB as a list of Python floats)
+    _cache: QueryCache = PrivateAttr(
+        default_factory=lambda: QueryCache(max_size=512, ttl_seconds=3600)
+    )
+
+    @staticmethod
+    def _key(text):
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+    def _lookup(self, texts):
+        """Return cache keys, cached vectors (None when missing) and indices to embed"""
+        keys = [self._key(text) for text in texts]
+        vectors = [self._cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        vectors = [None if vector is None else vector.tolist() for vector in vectors]
+        return keys, vectors, missing
+
+    def _store(self, keys, vectors, missing, fresh):
+        for i, vector in zip(missing, fresh):
+            vectors[i] = vector
+            self._cache.put(keys[i], np.asarray(vector, dtype=np.float32))
+        return vectors
+
+    def embed_documents(self, texts, chunk_size=0):
+        keys, vectors, missing = self._lookup(texts)
+        if not missing:
+            return vectors
+        fresh = super().embed_documents([texts[i] for i in missing], chunk_size)
+        return self._store(keys, vectors, missing, fresh)
+
+    async def aembed_documents(self, texts, chunk_size=0):
+        keys, vectors, missing = self._lookup(texts)
+        if not missing:
+            return vectors
+        fresh = await super().aembed_documents([texts[i] for i in missing], chunk_size)
+        return self._store(keys, vectors, missing, fresh)
+
+    def embed_query(self, text):
+        # Whitespace-only differences should not cost another API call
+        return self.embed_documents([" ".join(text.split())])[0]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([" ".join(text.split())]))[0]
 
 class VectorStoreManager:
-    def __init__(self):
+    def __init__(self, hnsw_space="cosine", hnsw_construction_ef=200, hnsw_m=32, hnsw_search_ef=128,
+                 backend=None, faiss_quantization=None):
         load_dotenv()
+        # "chroma" (default) or "faiss", overridable with VECTOR_STORE_BACKEND
+        self.backend = backend or os.getenv("VECTOR_STORE_BACKEND", "chroma")
+        if self.backend not in DEFAULT_PERSIST_DIRECTORIES:
+            raise ValueError(f"Unsupported vector store backend: {self.backend}")
+        # FAISS only: "sq8" or "pq" to store compressed vectors, overridable
+        # with FAISS_QUANTIZATION. Chroma always stores float32.
+        self.faiss_quantization = faiss_quantization or os.getenv("FAISS_QUANTIZATION") or None
         # Set the API key as an environment variable
         os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-        # Initialize embeddings without explicit API key parameter
-        self.embeddings = OpenAIEmbeddings()
+        # One keep-alive HTTP/2 pool per direction, so embedding and chat calls
+        # skip the TCP/TLS handshake. The async client must only be used from
+        # a single event loop.
+        self._http_client = httpx.Client(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        self._async_http_client = httpx.AsyncClient(http2=True, limits=HTTP_LIMITS, timeout=HTTP_TIMEOUT)
+        self.openai_client = openai.OpenAI(http_client=self._http_client, timeout=HTTP_TIMEOUT)
+        self.async_openai_client = openai.AsyncOpenAI(http_client=self._async_http_client, timeout=HTTP_TIMEOUT)
+        # Initialize embeddings without explicit API key parameter; repeated
+        # texts (e.g. the same question asked twice) are served from memory
+        self.embeddings = CachedEmbeddings(
+            client=self.openai_client.embeddings,
+            async_client=self.async_openai_client.embeddings
+        )
+        # HNSW settings are fixed when a collection is created; changing them
+        # requires rebuilding the vector store
+        self.collection_metadata = {
+            "hnsw:space": hnsw_space,
+            "hnsw:construction_ef": hnsw_construction_ef,
+            "hnsw:M": hnsw_m,
+            "hnsw:search_ef": hnsw_search_ef
+        }
+        self.hnsw_construction_ef = hnsw_construction_ef
+        self.hnsw_m = hnsw_m
+        self.hnsw_search_ef = hnsw_search_ef
+
+    def close(self):
+        """Close the pooled sync HTTP connections"""
+        self._http_client.close()
+
+    async def aclose(self):
+        """Close the pooled async HTTP connections, on the loop that used them"""
+        await self._async_http_client.aclose()
+
+    async def _embed_all(self, texts, batch=512, concurrency=8):
+        """Embed texts with up to `concurrency` batch requests in flight"""
+        # A fresh client per run, since asyncio.run() gives each run its own loop
+        client = AsyncOpenAI(http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=concurrency, max_connections=concurrency)
+        ))
+        semaphore = asyncio.Semaphore(concurrency)
+        batches = [texts[start:start + batch] for start in range(0, len(texts), batch)]
+        progress = tqdm(total=len(batches), desc="Embedding", unit="batch")
 
-    def create_vector_store(self, documents, persist_directory="data/chroma_db"):
-        """Create or update vector store"""
+        @retry(
+            retry=retry_if_exception_type(_RETRYABLE_ERRORS),
+            wait=wait_exponential(multiplier=1, max=60),
+            stop=stop_after_attempt(6),
+            reraise=True
+        )
+        async def embed_batch(batch_texts):
+            async with semaphore:
+                response = await client.embeddings.create(
+                    model=self.embeddings.model,
+                    input=batch_texts
+                )
+            progress.update(1)
+            return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+        try:
+            # gather keeps results in batch order regardless of completion order
+            results = await asyncio.gather(*(embed_batch(batch_texts) for batch_texts in batches))
+        finally:
+            progress.close()
+            await client.close()
+
+        return [vector for result in results for vector in result]
+
+    def embed_texts(self, texts, embed_batch_size=512, concurrency=8):
+        """Embed texts in large batches, issuing several API requests concurrently"""
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        vectors = asyncio.run(self._embed_all(texts, embed_batch_size, concurrency))
+        return np.asarray(vectors, dtype=np.float32)
+
+    def create_vector_store(self, documents, persist_directory=None, batch_size=200,
+                            embed_batch_size=512, concurrency=8):
+        """Create or update vector store, inserting pre-computed embeddings in batches"""
+        persist_directory = persist_directory or DEFAULT_PERSIST_DIRECTORIES[self.backend]
         if not os.path.exists(persist_directory):
             os.makedirs(persist_directory)
 
-        vector_store = Chroma.from_documents(
-            documents=documents,
-            embedding=self.embeddings,
-            persist_directory=persist_directory
+        texts = [doc.page_content for doc in documents]
+        metadatas = [doc.metadata for doc in documents]
+        vectors = self.embed_texts(texts, embed_batch_size, concurrency)
+
+        if self.backend == "faiss":
+            # Imported lazily so Chroma deployments never load faiss
+            from src.faiss_store import FaissVectorStore
+            return FaissVectorStore.create(
+                vectors, texts, metadatas, persist_directory, self.embeddings,
+                hnsw_m=self.hnsw_m, hnsw_construction_ef=self.hnsw_construction_ef,
+                quantization=self.faiss_quantization
+            )
+
+        vector_store = Chroma(
+            client=_chroma_client(persist_directory),
+            collection_name=CHROMA_COLLECTION_NAME,
+            embedding_function=self.embeddings,
+            collection_metadata=self.collection_metadata
         )
-        vector_store.persist()
+
+        self._check_hnsw_settings(vector_store._collection)
+
+        ids = [str(uuid.uuid4()) for _ in documents]
+
+        # Write straight to the collection so Chroma does not re-embed each batch
+        collection = vector_store._collection
+        for start in tqdm(range(0, len(documents), batch_size), desc="Indexing", unit="batch"):
+            end = start + batch_size
+            collection.add(
+                ids=ids[start:end],
+                embeddings=vectors[start:end].tolist(),
+                documents=texts[start:end],
+                metadatas=metadatas[start:end]
+            )
+        # PersistentClient writes through to disk, no explicit persist() needed
         return vector_store
 
-    def load_vector_store(self, persist_directory="data/chroma_db"):
+    def count_vectors(self, persist_directory=None):
+        """Number of chunks already in the vector store, 0 when there is none yet"""
+        persist_directory = persist_directory or DEFAULT_PERSIST_DIRECTORIES[self.backend]
+
+        if self.backend == "faiss":
+            from src.faiss_store import INDEX_FILENAME, FaissVectorStore
+            if not os.path.exists(os.path.join(persist_directory, INDEX_FILENAME)):
+                return 0
+            return FaissVectorStore.open(persist_directory, self.embeddings).index.ntotal
+
+        try:
+            collection = _chroma_client(persist_directory).get_collection(CHROMA_COLLECTION_NAME)
+        except (chromadb.errors.InvalidCollectionException, ValueError):
+            return 0
+        return collection.count()
+
+    def reset_vector_store(self, persist_directory=None):
+        """Delete every stored chunk so the store can be rebuilt from scratch"""
+        persist_directory = persist_directory or DEFAULT_PERSIST_DIRECTORIES[self.backend]
+
+        if self.backend == "faiss":
+            from src.faiss_store import INDEX_FILENAME, METADATA_FILENAME
+            for filename in (INDEX_FILENAME, METADATA_FILENAME):
+                path = os.path.join(persist_directory, filename)
+                if os.path.exists(path):
+                    os.remove(path)
+            return
+
+        try:
+            _chroma_client(persist_directory).delete_collection(CHROMA_COLLECTION_NAME)
+        except (chromadb.errors.InvalidCollectionException, ValueError):
+            pass
+
+    def load_vector_store(self, persist_directory=None):
         """Load existing vector store"""
-        if not os.path.exists(persist_directory):
-            raise ValueError("Vector store not found!")
+        persist_directory = persist_directory or DEFAULT_PERSIST_DIRECTORIES[self.backend]
+        # A Chroma server keeps its data on its own host
+        remote = self.backend == "chroma" and os.getenv("CHROMA_HOST")
+        if not remote and not os.path.exists(persist_directory):
+            raise VectorStoreNotFoundError("Vector store not found!")
 
-        return Chroma(
-            embedding_function=self.embeddings,
-            persist_directory=persist_directory
+        if self.backend == "faiss":
+            from src.faiss_store import FaissVectorStore
+            return FaissVectorStore.open(
+                persist_directory, self.embeddings, search_ef=self.hnsw_search_ef
+            )
+
+        vector_store = Chroma(
+            client=_chroma_client(persist_directory),
+            collection_name=CHROMA_COLLECTION_NAME,
+            embedding_function=self.embeddings
         )
+        self._check_hnsw_settings(vector_store._collection)
+        return vector_store
+
+    def _check_hnsw_settings(self, collection):
+        """Warn when an existing collection was built with other HNSW settings than requested"""
+        actual = dict(CHROMA_HNSW_DEFAULTS, **(collection.metadata or {}))
+        stale = {
+            key: actual.get(key) for key, value in self.collection_metadata.items()
+            if actual.get(key) != value
+        }
+        if stale:
+            # Chroma only applies collection metadata when the collection is created
+            logger.warning(
+                "Chroma collection %r uses %s instead of the requested HNSW settings; "
+                "run 'python process_pdfs.py --rebuild' to apply them",
+                collection.name, stale
+            )
@@ -0,0 +1,204 @@
+from langchain.schema import Document
+from langchain.schema.vectorstore import VectorStore
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+from src.embeddings import VectorStoreNotFoundError
+import faiss
+import json
+import logging
+import numpy as np
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "index.faiss"
+METADATA_FILENAME = "metadata.sqlite3"
+
+# HNSW keeps full vectors and is fast up to ~1M chunks; beyond that the
+# compressed IVF-PQ index keeps memory bounded
+IVFPQ_THRESHOLD = 1_000_000
+
+# Optional compression of the vectors stored in the HNSW graph: "sq8" keeps one
+# byte per dimension, "pq" keeps 64 one-byte codes per vector. Both trade a
+# little recall for much less memory traffic per distance computation.
+QUANTIZATION_MODES = (None, "sq8", "pq")
+PQ_SUBQUANTIZERS = 64
+# 8-bit PQ trains 256 centroids per sub-quantizer; faiss wants ~39 points each
+PQ_MIN_TRAINING_VECTORS = 256 * 39
+
+
+class FaissVectorStore(VectorStore):
+    """FAISS index with a SQLite sidecar holding chunk text and metadata
+
+    OpenAI embeddings are unit-normalised, so L2 ranking matches cosine ranking.
+    """
+
+    def __init__(self, index, connection, embedding_function, persist_directory, read_only=True):
+        self.index = index
+        self._connection = connection
+        self._embedding_function = embedding_function
+        self._persist_directory = persist_directory
+        self._read_only = read_only
+        self._lock = threading.Lock()
+
+    @property
+    def embeddings(self):
+        return self._embedding_function
+
+    @staticmethod
+    def build_index(dim, n_vectors, hnsw_m=32, hnsw_construction_ef=200, quantization=None):
+        """Pick an index type suited to the collection size and requested compression"""
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported FAISS quantization: {quantization}")
+        if n_vectors <= IVFPQ_THRESHOLD:
+            if quantization == "sq8":
+                index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, hnsw_m)
+            elif quantization == "pq" and n_vectors < PQ_MIN_TRAINING_VECTORS:
+                logger.warning(
+                    "%d vectors are too few to train PQ codebooks (need %d); using sq8 instead",
+                    n_vectors, PQ_MIN_TRAINING_VECTORS
+                )
+                index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_8bit, hnsw_m)
+            elif quantization == "pq":
+                index = faiss.IndexHNSWPQ(dim, PQ_SUBQUANTIZERS, hnsw_m)
+            else:
+                index = faiss.IndexHNSWFlat(dim, hnsw_m)
+            index.hnsw.efConstruction = hnsw_construction_ef
+            return index
+        quantizer = faiss.IndexFlatL2(dim)
+        return faiss.IndexIVFPQ(quantizer, dim, 1024, 16, 8)
+
+    @classmethod
+    def open(cls, persist_directory, embedding_function, read_only=True, search_ef=128, nprobe=16):
+        """Open an existing index and its metadata, optionally read-only"""
+        index_path = os.path.join(persist_directory, INDEX_FILENAME)
+        metadata_path = os.path.join(persist_directory, METADATA_FILENAME)
+        if not os.path.exists(index_path) or not os.path.exists(metadata_path):
+            raise VectorStoreNotFoundError("Vector store not found!")
+
+        if read_only:
+            # faiss can only memory-map IVF inverted lists; HNSW indexes are
+            # always read fully into memory
+            index = faiss.read_index(index_path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+            connection = sqlite3.connect(
+                f"file:{metadata_path}?mode=ro", uri=True, check_same_thread=False
+            )
+        else:
+            index = faiss.read_index(index_path)
+            connection = sqlite3.connect(metadata_path, check_same_thread=False)
+
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efSearch = search_ef
+        elif isinstance(index, faiss.IndexIVF):
+            index.nprobe = nprobe
+            # Needed to reconstruct candidate vectors for MMR
+            index.make_direct_map()
+
+        return cls(index, connection, embedding_function, persist_directory, read_only)
+
+    @classmethod
+    def create(cls, vectors, texts, metadatas, persist_directory, embedding_function,
+               hnsw_m=32, hnsw_construction_ef=200, quantization=None):
+        """
+        Create an index from pre-computed vectors, or append to an existing one
+
+        The quantization mode only applies when a new index is built; appends
+        reuse the existing index as is.
+        """
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if os.path.exists(os.path.join(persist_directory, INDEX_FILENAME)):
+            store = cls.open(persist_directory, embedding_function, read_only=False)
+        else:
+            index = cls.build_index(
+                vectors.shape[1], len(vectors), hnsw_m, hnsw_construction_ef, quantization
+            )
+            if not index.is_trained:
+                index.train(vectors)
+            connection = sqlite3.connect(
+                os.path.join(persist_directory, METADATA_FILENAME), check_same_thread=False
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks "
+                "(id INTEGER PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            store = cls(index, connection, embedding_function, persist_directory, read_only=False)
+
+        store._add_vectors(vectors, texts, metadatas)
+        store.persist()
+        return store
+
+    def _add_vectors(self, vectors, texts, metadatas):
+        if self._read_only:
+            raise ValueError("FAISS index was opened read-only")
+
+        with self._lock:
+            start = self.index.ntotal
+            self.index.add(vectors)
+            self._connection.executemany(
+                "INSERT INTO chunks (id, page_content, metadata) VALUES (?, ?, ?)",
+                [
+                    (start + offset, text, json.dumps(metadata or {}))
+                    for offset, (text, metadata) in enumerate(zip(texts, metadatas))
+                ]
+            )
+            self._connection.commit()
+        return [str(start + offset) for offset in range(len(texts))]
+
+    def persist(self):
+        """Write the index to disk"""
+        if self._read_only:
+            return
+        faiss.write_index(self.index, os.path.join(self._persist_directory, INDEX_FILENAME))
+
+    def _get_documents(self, ids):
+        ids = [int(i) for i in ids if i >= 0]
+        if not ids:
+            return []
+
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT id, page_content, metadata FROM chunks WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        by_id = {row[0]: Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows}
+        return [by_id[i] for i in ids if i in by_id]
+
+    def add_texts(self, texts, metadatas=None, **kwargs):
+        texts = list(texts)
+        vectors = np.asarray(self._embedding_function.embed_documents(texts), dtype=np.float32)
+        ids = self._add_vectors(vectors, texts, metadatas or [{}] * len(texts))
+        self.persist()
+        return ids
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        query = np.asarray([embedding], dtype=np.float32)
+        _, ids = self.index.search(query, k)
+        return self._get_documents(ids[0])
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector(self._embedding_function.embed_query(query), k)
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        query = np.asarray([embedding], dtype=np.float32)
+        _, ids = self.index.search(query, fetch_k)
+        ids = [int(i) for i in ids[0] if i >= 0]
+        if not ids:
+            return []
+
+        candidates = np.vstack([self.index.reconstruct(i) for i in ids])
+        selected = maximal_marginal_relevance(query[0], candidates, lambda_mult=lambda_mult, k=k)
+        return self._get_documents([ids[i] for i in selected])
+
+    def max_marginal_relevance_search(self, query, k=4, fetch_k=20, lambda_mult=0.5, **kwargs):
+        return self.max_marginal_relevance_search_by_vector(
+            self._embedding_function.embed_query(query), k, fetch_k, lambda_mult
+        )
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, persist_directory="data/faiss_index", **kwargs):
+        texts = list(texts)
+        if not os.path.exists(persist_directory):
+            os.makedirs(persist_directory)
+        vectors = embedding.embed_documents(texts)
+        return cls.create(vectors, texts, metadatas or [{}] * len(texts), persist_directory, embedding)
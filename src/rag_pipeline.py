@@ -1,27 +1,24 @@
-from langchain.chains import RetrievalQA
-from langchain.llms import OpenAI
 from langchain.prompts import PromptTemplate
-from src.embeddings import VectorStoreManager
+from langchain_openai import ChatOpenAI
+from src.embeddings import HTTP_TIMEOUT, VectorStoreManager
+from src.query_cache import QueryCache
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import NamedTuple
+import asyncio
+import functools
+import logging
 import os
 import re
+import sys
+import threading
 
-class RAGPipeline:
-    def __init__(self, vector_db_path):
-        """
-        Initialize the RAG pipeline with a vector database
-        
-        Args:
-            vector_db_path: Path to the Chroma vector database
-        """
-        self.vector_store_manager = VectorStoreManager()
-        self.vector_store = self.vector_store_manager.load_vector_store(vector_db_path)
-        self.retriever = self.vector_store.as_retriever(
-            search_type="similarity",
-            search_kwargs={"k": 5}  # Retrieve top 5 most relevant documents
-        )
-        
-        # Define a better prompt template for our RAG pipeline
-        self.template = """
+logger = logging.getLogger(__name__)
+
+# 从文件名生成标题时使用，只编译一次
+_UNDERSCORE_RE = re.compile(r'[_\-]')
+
+# Define a better prompt template for our RAG pipeline
+_QA_TEMPLATE = """
         You are an expert AI assistant specializing in oocyte maturation research. 
         Use the following pieces of context to answer the question at the end.
         If you don't know the answer, just say that you don't know, don't try to make up an answer.
@@ -33,25 +30,231 @@ class RAGPipeline:
         
         Answer:
         """
+
+_QA_PROMPT = PromptTemplate(
+    template=_QA_TEMPLATE,
+    input_variables=["context", "question"]
+)
+
+# Marks the end of an answer streamed between event loops
+_STREAM_END = object()
+
+# Process-wide pipeline returned by get_pipeline()
+_INSTANCE = None
+_INSTANCE_LOCK = threading.Lock()
+
+@functools.lru_cache(maxsize=1024)
+def _title_from_source(source):
+    """Derive a readable title from a source file path"""
+    name_without_ext = os.path.splitext(os.path.basename(source))[0]
+    return _UNDERSCORE_RE.sub(' ', name_without_ext).title()
+
+class CitationRow(NamedTuple):
+    """Citation fields extracted once from a retrieved document's metadata"""
+    paper_title: str
+    authors: str
+    journal: str
+    year: str
+    volume: str
+    pages: str
+    doi: str
+    source: str
+
+    @classmethod
+    def from_metadata(cls, metadata):
+        """
+        Build a row from document metadata, using empty strings for missing fields
         
-        self.QA_PROMPT = PromptTemplate(
-            template=self.template,
-            input_variables=["context", "question"]
+        Args:
+            metadata: Metadata dict of a retrieved document
+            
+        Returns:
+            CitationRow with one value per citation field
+        """
+        get = metadata.get
+        return cls(
+            get('paper_title', ''),
+            get('authors', ''),
+            get('journal', ''),
+            get('year', ''),
+            get('volume', ''),
+            get('page', get('pages', '')),
+            get('doi', ''),
+            get('source', '')
         )
+
+    def format(self, index):
+        """
+        Render the row as a markdown citation
         
-        self.llm = OpenAI(
-            temperature=0,  # More deterministic responses
-            openai_api_key=os.getenv("OPENAI_API_KEY")
+        Args:
+            index: Position of the document in the retrieved list, used when
+                there is no title
+            
+        Returns:
+            Formatted citation string
+        """
+        paper_title = self.paper_title
+        
+        # 如果没有标题，尝试从文件名生成
+        if not paper_title and self.source:
+            paper_title = _title_from_source(self.source)
+        
+        # 添加标题（必须有）
+        citation_parts = [f"**Title**: {paper_title}" if paper_title else f"**Document {index+1}**"]
+        
+        # 添加其他可选元数据
+        if self.authors:
+            citation_parts.append(f"**Authors**: {self.authors}")
+        
+        if self.journal:
+            journal_info = self.journal
+            if self.volume:
+                journal_info += f" {self.volume}"
+            if self.pages:
+                journal_info += f", {self.pages}"
+            if self.year:
+                journal_info += f" ({self.year})"
+            citation_parts.append(f"**Journal**: {journal_info}")
+        elif self.year:
+            citation_parts.append(f"**Year**: {self.year}")
+        
+        if self.doi:
+            citation_parts.append(f"**DOI**: {self.doi}")
+        
+        return " | ".join(citation_parts)
+
+class RAGPipeline:
+    def __init__(self, vector_db_path=None, max_batch=16, max_wait_ms=75, warmup=True, timeout=None):
+        """
+        Initialize the RAG pipeline with a vector database
+        
+        Args:
+            vector_db_path: Path to the vector database (defaults to the
+                backend's standard location)
+            max_batch: Maximum number of concurrent ask() calls answered together
+            max_wait_ms: How long the first query in a batch waits for others
+            warmup: Pay one-off startup costs now rather than on the first question
+            timeout: Seconds ask() waits for an answer (defaults to the batching
+                delay plus one embedding and one chat request timeout)
+        """
+        self.vector_store_manager = VectorStoreManager()
+        self.vector_store = self.vector_store_manager.load_vector_store(vector_db_path)
+        self.search_kwargs = {
+            "k": 4,  # Return the 4 most relevant, mutually diverse documents
+            "fetch_k": 20,  # Candidates fetched by similarity before re-ranking
+            "lambda_mult": 0.5
+        }
+        self.retriever = self.vector_store.as_retriever(
+            search_type="mmr",  # Diversify results so one paper doesn't fill the context
+            search_kwargs=self.search_kwargs
         )
         
-        # Initialize the QA chain
-        self.qa = RetrievalQA.from_chain_type(
-            llm=self.llm,
-            chain_type="stuff",  # "stuff" means to stuff all documents into the prompt
-            retriever=self.retriever,
-            return_source_documents=True,  # Important for citations
-            chain_type_kwargs={"prompt": self.QA_PROMPT}
+        # Parsed once at import time and shared by every instance
+        self.template = _QA_TEMPLATE
+        self.QA_PROMPT = _QA_PROMPT
+        
+        self.llm = ChatOpenAI(
+            model="gpt-4o-mini",
+            temperature=0,  # More deterministic responses
+            streaming=True,  # Lets the UI render tokens as they arrive
+            verbose=os.getenv("RAG_VERBOSE") == "1",  # LangChain's per-call tracing is opt-in
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            # Share the embeddings' keep-alive connection pools
+            client=self.vector_store_manager.openai_client.chat.completions,
+            async_client=self.vector_store_manager.async_openai_client.chat.completions
         )
+        
+        # Answers to repeated questions are served from memory for a few minutes
+        self._cache = QueryCache(max_size=1000, ttl_seconds=300)
+        
+        # Concurrent ask() calls are coalesced into micro-batches on a dedicated
+        # event loop thread, started on first use
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self.timeout = timeout or max_wait_ms / 1000 + 2 * HTTP_TIMEOUT
+        self._loop = None
+        self._thread = None
+        self._closed = False
+        self._queue = None
+        self._worker = None
+        # asyncio only keeps weak references to running tasks
+        self._batch_tasks = set()
+        self._loop_lock = threading.Lock()
+        
+        if warmup:
+            self.warmup()
+    
+    def warmup(self):
+        """
+        Pay one-off startup costs before the first question: load the vector
+        index, start the batching loop and open the API connections that
+        ask() and ask_stream() use. The chat model is only pinged (a billed
+        1-token request) when RAG_WARMUP_LLM=1.
+        """
+        self._check_open()
+        try:
+            # Loads the index and opens the sync embedding connection
+            self.vector_store.similarity_search("warm", k=1)
+            asyncio.run_coroutine_threadsafe(
+                self._warmup_async(), self._ensure_batch_loop()
+            ).result(timeout=self.timeout)
+            if os.getenv("RAG_WARMUP_LLM") == "1":
+                self.llm.invoke("ok", max_tokens=1)
+        except Exception as e:
+            # A failed warmup only means the first question is slower
+            logger.warning("RAG pipeline warmup failed: %s", e)
+    
+    async def _warmup_async(self):
+        # Different text from the sync warmup, so the embedding cache cannot answer it
+        await self.vector_store_manager.embeddings.aembed_query("warm up")
+        if os.getenv("RAG_WARMUP_LLM") == "1":
+            await self.llm.ainvoke("ok", max_tokens=1)
+    
+    def close(self):
+        """
+        Stop the batching loop and close the pooled OpenAI connections
+        
+        The pipeline cannot be used afterwards.
+        """
+        with self._loop_lock:
+            if self._closed:
+                return
+            self._closed = True
+            loop, thread = self._loop, self._thread
+        if loop is None:
+            # The async client never opened a connection
+            asyncio.run(self.vector_store_manager.aclose())
+        else:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        self.vector_store_manager.close()
+    
+    def _check_open(self):
+        if self._closed:
+            raise RuntimeError("RAGPipeline is closed")
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    @staticmethod
+    def _cache_key(question):
+        """Normalize case and whitespace so trivially different questions share an entry"""
+        return " ".join(question.lower().split())
+    
+    def get_cache_stats(self):
+        """
+        Report how effective the response cache is
+        
+        Returns:
+            Dict with hits, misses, hit_rate and size
+        """
+        return self._cache.stats()
     
     def format_sources(self, source_documents):
         """
@@ -63,93 +266,20 @@ class RAGPipeline:
         Returns:
             List of formatted citations
         """
-        citations = []
-        seen_sources = set()  # To avoid duplicate citations
-        
-        # Debug output
-        print(f"Number of source documents retrieved: {len(source_documents)}")
-        
-        for i, doc in enumerate(source_documents[:2]):  # Print first 2 docs for debugging
-            if hasattr(doc, 'metadata'):
-                print(f"Document {i+1} metadata: {doc.metadata}")
-            else:
-                print(f"Document {i+1} has no metadata attribute")
-            
-            if hasattr(doc, 'page_content'):
-                print(f"Document {i+1} content preview: {doc.page_content[:100]}...")
-            else:
-                print(f"Document {i+1} has no page_content attribute")
-        
+        # dict 保留插入顺序，同时按来源去重
+        seen = {}
         for i, doc in enumerate(source_documents):
-            # 确保文档有元数据
-            if not hasattr(doc, 'metadata'):
-                doc.metadata = {}
-            
-            # 获取基本引用信息，使用合理的默认值
-            paper_title = doc.metadata.get('paper_title', '')
-            authors = doc.metadata.get('authors', '')
-            journal = doc.metadata.get('journal', '')
-            year = doc.metadata.get('year', '')
-            volume = doc.metadata.get('volume', '')
-            pages = doc.metadata.get('page', doc.metadata.get('pages', ''))
-            doi = doc.metadata.get('doi', '')
-            source = doc.metadata.get('source', '')
-            
-            # 如果没有标题，尝试从文件名生成
-            if not paper_title and source:
-                base_filename = os.path.basename(source)
-                name_without_ext = os.path.splitext(base_filename)[0]
-                paper_title = re.sub(r'[_\-]', ' ', name_without_ext).title()
-            
-            # 构建引用文本
-            citation_parts = []
-            
-            # 添加标题（必须有）
-            if paper_title:
-                citation_parts.append(f"**Title**: {paper_title}")
-            else:
-                citation_parts.append(f"**Document {i+1}**")
-            
-            # 添加其他可选元数据
-            if authors:
-                citation_parts.append(f"**Authors**: {authors}")
-            
-            if journal:
-                journal_info = journal
-                if volume:
-                    journal_info += f" {volume}"
-                if pages:
-                    journal_info += f", {pages}"
-                if year:
-                    journal_info += f" ({year})"
-                citation_parts.append(f"**Journal**: {journal_info}")
-            elif year:
-                citation_parts.append(f"**Year**: {year}")
-            
-            if doi:
-                citation_parts.append(f"**DOI**: {doi}")
-            
-            # 构建完整引用
-            citation = " | ".join(citation_parts)
-            
-            # 创建引用键以避免重复
-            if source:
-                citation_key = source
-            else:
-                citation_key = f"{paper_title}_{authors}_{journal}"
-            
-            if citation_key not in seen_sources:
-                citations.append(citation)
-                seen_sources.add(citation_key)
-        
-        if not citations and len(source_documents) > 0:
-            # 找到文档但没有足够的元数据创建引用
-            return ["Sources found but citation metadata is incomplete"]
-        elif not citations:
+            # LangChain documents always carry a metadata dict
+            metadata = doc.metadata
+            key = metadata.get('doc_hash') or metadata.get('source') or id(doc)
+            if key not in seen:
+                seen[key] = CitationRow.from_metadata(metadata).format(i)
+        
+        if not seen:
             # 没有找到相关文档
             return ["No relevant sources found"]
         
-        return citations
+        return list(seen.values())
     
     def ask(self, question):
         """
@@ -161,33 +291,389 @@ class RAGPipeline:
         Returns:
             Dict containing the answer and formatted citations
         """
+        self._check_open()
+        cached = self._cache.get(self._cache_key(question))
+        if cached is not None:
+            return cached
+        
         try:
-            # Get response from the QA chain
-            response = self.qa({"query": question})
+            future = asyncio.run_coroutine_threadsafe(self._submit(question), self._ensure_batch_loop())
+            return future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            # Withdraw the question so a stuck request does not complete it later
+            future.cancel()
+            return self._timeout_response()
+        except Exception as e:
+            logger.exception("Error in RAG pipeline: %s", e)
+            return self._error_response(e)
+    
+    async def ask_async(self, question):
+        """
+        Ask a question without blocking the caller's event loop
+        
+        Args:
+            question: The question to ask
             
-            # Debug info
-            print(f"RAG response keys: {response.keys()}")
-            source_docs = response.get("source_documents", [])
-            print(f"Number of source documents in response: {len(source_docs)}")
+        Returns:
+            Dict containing the answer and formatted citations
+        """
+        self._check_open()
+        cached = self._cache.get(self._cache_key(question))
+        if cached is not None:
+            return cached
+        
+        try:
+            future = asyncio.run_coroutine_threadsafe(self._submit(question), self._ensure_batch_loop())
+            # Timing out cancels the wrapped future, which withdraws the question
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            return self._timeout_response()
+        except Exception as e:
+            logger.exception("Error in RAG pipeline: %s", e)
+            return self._error_response(e)
+    
+    @staticmethod
+    def _error_response(error):
+        """Fallback response returned when a question could not be answered"""
+        return {
+            "answer": f"I encountered an error while processing your question. Please try again or rephrase your question. Error: {str(error)}",
+            "source_documents": [],
+            "formatted_citations": ["Error processing sources"]
+        }
+    
+    def _timeout_response(self):
+        """Fallback response for a question that was not answered within self.timeout"""
+        logger.error("RAG pipeline gave no answer within %.0f s", self.timeout)
+        return self._error_response(TimeoutError(f"no answer within {self.timeout:.0f} s"))
+    
+    def _ensure_batch_loop(self):
+        """Start the batching event loop thread on first use"""
+        with self._loop_lock:
+            self._check_open()
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="rag-batcher", daemon=True)
+                thread.start()
+                asyncio.run_coroutine_threadsafe(self._start_batcher(), loop).result()
+                self._loop, self._thread = loop, thread
+        return self._loop
+    
+    async def _start_batcher(self):
+        # The queue must be created on the loop that consumes it
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.ensure_future(self._batch_worker())
+    
+    async def _shutdown(self):
+        # The batch worker plus any batches and streams still in flight
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Async connections belong to this loop, so they are closed on it
+        await self.vector_store_manager.aclose()
+    
+    async def _submit(self, question):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, future))
+        return await future
+    
+    async def _batch_worker(self):
+        """Collect up to max_batch queries arriving within max_wait_ms of each other"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Answer in the background so the next batch can start collecting
+            task = asyncio.ensure_future(self._process_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+    
+    async def _process_batch(self, batch):
+        """Answer a batch, making sure every caller's future is resolved"""
+        try:
+            await self._answer_batch(batch)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+    
+    async def _answer_batch(self, batch):
+        """Answer a batch: one embedding request, parallel searches, concurrent LLM calls"""
+        questions = [question for question, _ in batch]
+        logger.debug("Answering batch of %d questions", len(batch))
+        
+        # Same whitespace normalization as embed_query, so both paths share cache entries
+        vectors = await self.vector_store_manager.embeddings.aembed_documents(
+            [" ".join(question.split()) for question in questions]
+        )
+        # Vector stores have no native async search, so run them on the executor
+        loop = asyncio.get_running_loop()
+        retrieved = await asyncio.gather(*(
+            loop.run_in_executor(None, functools.partial(
+                self.vector_store.max_marginal_relevance_search_by_vector, vector, **self.search_kwargs
+            ))
+            for vector in vectors
+        ))
+        
+        answers = await asyncio.gather(
+            *(self.llm.ainvoke(self._build_prompt(q, docs)) for q, docs in zip(questions, retrieved)),
+            return_exceptions=True
+        )
+        
+        for (question, future), source_docs, answer in zip(batch, retrieved, answers):
+            if future.done():
+                continue
+            if isinstance(answer, BaseException):
+                future.set_exception(answer)
+                continue
             
-            # Format the source documents
-            formatted_citations = self.format_sources(source_docs)
+            # One bad document should only fail its own question
+            try:
+                result = {
+                    "answer": answer.content or "Could not generate an answer",
+                    "source_documents": source_docs,
+                    "formatted_citations": self.format_sources(source_docs)
+                }
+                self._cache.put(self._cache_key(question), result)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            future.set_result(result)
+    
+    def _build_prompt(self, question, source_documents):
+        """
+        Fill the QA prompt the same way the "stuff" chain does
+        
+        Args:
+            question: The question to ask
+            source_documents: Documents to use as context
+            
+        Returns:
+            Prompt string ready for the LLM
+        """
+        context = "\n\n".join(doc.page_content for doc in source_documents)
+        return self.QA_PROMPT.format(context=context, question=question)
+    
+    def ask_stream(self, question):
+        """
+        Ask a question and stream the answer as it is generated
+        
+        Args:
+            question: The question to ask
             
-            # Return a structured response
-            return {
-                "answer": response.get("result", "Could not generate an answer"),
+        Returns:
+            Dict containing an iterator over answer text chunks
+            ("answer_stream") and the formatted citations
+        """
+        self._check_open()
+        key = self._cache_key(question)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return dict(cached, answer_stream=iter([cached["answer"]]))
+        
+        source_docs = self.retriever.get_relevant_documents(question)
+        prompt = self._build_prompt(question, source_docs)
+        formatted_citations = self.format_sources(source_docs)
+        
+        def stream():
+            chunks = []
+            for chunk in self.llm.stream(prompt):
+                chunks.append(chunk.content)
+                yield chunk.content
+            # Only fully streamed answers are cached
+            self._cache.put(key, {
+                "answer": "".join(chunks),
                 "source_documents": source_docs,
                 "formatted_citations": formatted_citations
-            }
+            })
+        
+        return {
+            "answer_stream": stream(),
+            "source_documents": source_docs,
+            "formatted_citations": formatted_citations
+        }
+    
+    async def aask_stream(self, question):
+        """
+        Ask a question and stream the answer without blocking the caller's event loop
+        
+        Args:
+            question: The question to ask
             
+        Yields:
+            Answer text chunks as they are generated, then a final
+            {"sources": [...]} dict with the formatted citations
+        """
+        self._check_open()
+        key = self._cache_key(question)
+        cached = self._cache.get(key)
+        if cached is not None:
+            yield cached["answer"]
+            yield {"sources": cached["formatted_citations"]}
+            return
+        
+        # The async OpenAI client belongs to the batching loop, so the answer is
+        # generated there and handed over chunk by chunk
+        caller_loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        
+        def emit(chunk):
+            caller_loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+        
+        future = asyncio.run_coroutine_threadsafe(
+            self._stream_answer(question, emit), self._ensure_batch_loop()
+        )
+        try:
+            while True:
+                chunk = await chunks.get()
+                if chunk is _STREAM_END:
+                    break
+                yield chunk
+            result = await asyncio.wrap_future(future)
         except Exception as e:
-            import traceback
-            print(f"Error in RAG pipeline: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Error in RAG pipeline: %s", e)
+            result = self._error_response(e)
+            yield result["answer"]
+        finally:
+            # Stop generating if the consumer gave up early
+            future.cancel()
+        
+        yield {"sources": result["formatted_citations"]}
+    
+    async def _stream_answer(self, question, emit):
+        """Retrieve context and stream the answer through emit(), on the batching loop"""
+        try:
+            vector = await self.vector_store_manager.embeddings.aembed_query(question)
+            source_docs = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+                self.vector_store.max_marginal_relevance_search_by_vector, vector, **self.search_kwargs
+            ))
+            chunks = []
+            async for chunk in self.llm.astream(self._build_prompt(question, source_docs)):
+                chunks.append(chunk.content)
+                emit(chunk.content)
+        finally:
+            emit(_STREAM_END)
+        
+        result = {
+            "answer": "".join(chunks) or "Could not generate an answer",
+            "source_documents": source_docs,
+            "formatted_citations": self.format_sources(source_docs)
+        }
+        self._cache.put(self._cache_key(question), result)
+        return result
+    
+    def ask_batch(self, questions):
+        """
+        Ask several questions at once
+        
+        Uncached questions go through the same micro-batcher as ask(), so they
+        share embedding requests and their answers are cached.
+        
+        Args:
+            questions: List of questions to ask
             
-            # Return a fallback response
-            return {
-                "answer": f"I encountered an error while processing your question. Please try again or rephrase your question. Error: {str(e)}",
-                "source_documents": [],
-                "formatted_citations": ["Error processing sources"]
-            }
\ No newline at end of file
+        Returns:
+            List of dicts in the same format as ask(), one per question
+        """
+        self._check_open()
+        results = [self._cache.get(self._cache_key(question)) for question in questions]
+        pending = [i for i, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+        
+        try:
+            future = asyncio.run_coroutine_threadsafe(
+                self._submit_all([questions[i] for i in pending]), self._ensure_batch_loop()
+            )
+            answers = future.result(timeout=self.timeout)
+        except FuturesTimeoutError:
+            future.cancel()
+            answers = [self._timeout_response()] * len(pending)
+        except Exception as e:
+            logger.exception("Error in RAG pipeline: %s", e)
+            # Return a fallback response for every question
+            answers = [self._error_response(e)] * len(pending)
+        
+        for i, answer in zip(pending, answers):
+            if isinstance(answer, BaseException):
+                logger.error("Error in RAG pipeline: %s", answer)
+                answer = self._error_response(answer)
+            results[i] = answer
+        return results
+    
+    async def _submit_all(self, questions):
+        return await asyncio.gather(*(self._submit(question) for question in questions), return_exceptions=True)
+
+
+def get_pipeline(vector_db_path=None):
+    """
+    Return the process-wide RAG pipeline, creating it on first use
+    
+    Args:
+        vector_db_path: Path to the vector database, only used on first call
+        
+    Returns:
+        The shared RAGPipeline instance
+    """
+    global _INSTANCE
+    with _INSTANCE_LOCK:
+        if _INSTANCE is None:
+            _INSTANCE = RAGPipeline(vector_db_path)
+    return _INSTANCE
+
+
+async def _answer(rag, question):
+    response = await rag.ask_async(question)
+    print(f"Q: {question}\nA: {response['answer']}")
+    for citation in response["formatted_citations"]:
+        print(f"  - {citation}")
+
+
+async def _answer_stream(rag, question):
+    async for chunk in rag.aask_stream(question):
+        if isinstance(chunk, dict):
+            print()
+            for citation in chunk["sources"]:
+                print(f"  - {citation}")
+        else:
+            print(chunk, end="", flush=True)
+
+
+async def main():
+    """
+    Answer questions read from stdin, one per line: streamed one at a time
+    when typed interactively, otherwise all answered concurrently
+    """
+    rag = get_pipeline()
+    loop = asyncio.get_running_loop()
+    interactive = sys.stdin.isatty()
+    tasks = []
+    while True:
+        if interactive:
+            print("> ", end="", flush=True)
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        question = line.strip()
+        if not question:
+            continue
+        if interactive:
+            await _answer_stream(rag, question)
+        else:
+            tasks.append(asyncio.ensure_future(_answer(rag, question)))
+    await asyncio.gather(*tasks)
+    # close() blocks on the batching loop, so keep it off this one
+    await loop.run_in_executor(None, rag.close)
+
+
+if __name__ == "__main__":
+    # e.g. python -m src.rag_pipeline, or python -m src.rag_pipeline < questions.txt
+    asyncio.run(main())
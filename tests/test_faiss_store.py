@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+import zlib
+
+faiss_store = pytest.importorskip("src.faiss_store")
+FaissVectorStore = faiss_store.FaissVectorStore
+
+
+class FakeEmbeddings:
+    """Deterministic unit vectors so tests never call the OpenAI API"""
+
+    def __init__(self, dim=16):
+        self.dim = dim
+
+    def _embed(self, text):
+        rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+        vector = rng.standard_normal(self.dim).astype(np.float32)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _create(tmp_path, texts, embeddings, **kwargs):
+    vectors = embeddings.embed_documents(texts)
+    metadatas = [{"source": f"{text}.pdf", "page": i} for i, text in enumerate(texts)]
+    return FaissVectorStore.create(vectors, texts, metadatas, str(tmp_path), embeddings, **kwargs)
+
+
+@pytest.mark.parametrize("quantization", [None, "sq8"])
+def test_create_open_search_round_trip(tmp_path, quantization):
+    embeddings = FakeEmbeddings()
+    texts = [f"chunk {i}" for i in range(50)]
+    _create(tmp_path, texts, embeddings, quantization=quantization)
+
+    store = FaissVectorStore.open(str(tmp_path), embeddings)
+
+    assert store.index.ntotal == len(texts)
+    top = store.similarity_search("chunk 7", k=3)
+    assert top[0].page_content == "chunk 7"
+    assert top[0].metadata == {"source": "chunk 7.pdf", "page": 7}
+
+    diverse = store.max_marginal_relevance_search("chunk 7", k=4, fetch_k=10)
+    assert len(diverse) == 4
+    assert diverse[0].page_content == "chunk 7"
+    assert len({doc.page_content for doc in diverse}) == 4
+
+
+def test_create_appends_to_existing_index(tmp_path):
+    embeddings = FakeEmbeddings()
+    _create(tmp_path, ["first", "second"], embeddings)
+    _create(tmp_path, ["third"], embeddings)
+
+    store = FaissVectorStore.open(str(tmp_path), embeddings)
+
+    assert store.index.ntotal == 3
+    assert store.similarity_search("third", k=1)[0].page_content == "third"
+
+
+def test_read_only_store_rejects_writes(tmp_path):
+    embeddings = FakeEmbeddings()
+    _create(tmp_path, ["only"], embeddings)
+
+    store = FaissVectorStore.open(str(tmp_path), embeddings)
+
+    with pytest.raises(ValueError):
+        store.add_texts(["more"])
+
+
+def test_ivfpq_index_is_memory_mapped_read_only(tmp_path, monkeypatch):
+    # Large collections switch to IVF-PQ, the only index type faiss can mmap
+    monkeypatch.setattr(faiss_store, "IVFPQ_THRESHOLD", 0)
+    embeddings = FakeEmbeddings()
+    texts = [f"chunk {i}" for i in range(1100)]
+    _create(tmp_path, texts, embeddings)
+
+    store = FaissVectorStore.open(str(tmp_path), embeddings)
+
+    assert isinstance(store.index, faiss_store.faiss.IndexIVFPQ)
+    assert len(store.max_marginal_relevance_search("chunk 3", k=4, fetch_k=20)) == 4
+
+
+def test_missing_store_raises_not_found(tmp_path):
+    from src.embeddings import VectorStoreNotFoundError
+
+    with pytest.raises(VectorStoreNotFoundError):
+        FaissVectorStore.open(str(tmp_path), FakeEmbeddings())
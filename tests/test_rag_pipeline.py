@@ -0,0 +1,299 @@
+import asyncio
+import threading
+import types
+
+import pytest
+
+rag_pipeline = pytest.importorskip("src.rag_pipeline")
+from langchain.schema import Document
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.batches = []
+        self.async_queries = []
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+    async def aembed_query(self, text):
+        self.async_queries.append(text)
+        return [float(len(text))]
+
+    async def aembed_documents(self, texts):
+        self.batches.append(list(texts))
+        return [[float(len(text))] for text in texts]
+
+
+class FakeVectorStore:
+    def __init__(self):
+        self.docs = [Document(page_content="context", metadata={"source": "papers/oocyte_maturation.pdf"})]
+
+    def as_retriever(self, **kwargs):
+        return self
+
+    def get_relevant_documents(self, question):
+        return self.docs
+
+    def similarity_search(self, query, k=4):
+        return self.docs[:k]
+
+    def max_marginal_relevance_search_by_vector(self, embedding, k=4, fetch_k=20, lambda_mult=0.5):
+        return self.docs
+
+
+class FakeVectorStoreManager:
+    def __init__(self):
+        self.embeddings = FakeEmbeddings()
+        client = types.SimpleNamespace(chat=types.SimpleNamespace(completions=None))
+        self.openai_client = client
+        self.async_openai_client = client
+        self.closed = []
+
+    def load_vector_store(self, persist_directory=None):
+        return FakeVectorStore()
+
+    def close(self):
+        self.closed.append("sync")
+
+    async def aclose(self):
+        self.closed.append("async")
+
+
+class FakeChatModel:
+    """Answers "answer: <question>", optionally slowly or by raising"""
+
+    def __init__(self, **kwargs):
+        self.delay = 0
+        self.error = None
+        self.invocations = []
+        self.stream_closed = threading.Event()
+
+    @staticmethod
+    def _question(prompt):
+        if "Question: " not in prompt:
+            return prompt
+        return prompt.split("Question: ")[1].split("\n")[0]
+
+    def invoke(self, prompt, **kwargs):
+        self.invocations.append(kwargs)
+        return FakeMessage("ok")
+
+    async def ainvoke(self, prompt, **kwargs):
+        self.invocations.append(kwargs)
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return FakeMessage(f"answer: {self._question(prompt)}")
+
+    async def astream(self, prompt):
+        try:
+            for token in ("answer", ": ", self._question(prompt)):
+                await asyncio.sleep(self.delay)
+                yield FakeMessage(token)
+        finally:
+            self.stream_closed.set()
+
+    def stream(self, prompt):
+        yield FakeMessage(f"answer: {self._question(prompt)}")
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr(rag_pipeline, "VectorStoreManager", FakeVectorStoreManager)
+    monkeypatch.setattr(rag_pipeline, "ChatOpenAI", FakeChatModel)
+    rag = rag_pipeline.RAGPipeline(warmup=False, max_wait_ms=50, timeout=5)
+    yield rag
+    rag.close()
+
+
+def _ask_concurrently(rag, questions):
+    results = [None] * len(questions)
+
+    def ask(i):
+        results[i] = rag.ask(questions[i])
+
+    threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(questions))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def test_concurrent_asks_share_one_embedding_request(pipeline):
+    questions = [f"question {i}" for i in range(8)]
+
+    results = _ask_concurrently(pipeline, questions)
+
+    assert [result["answer"] for result in results] == [f"answer: {q}" for q in questions]
+    assert sorted(q for batch in pipeline.vector_store_manager.embeddings.batches for q in batch) == sorted(questions)
+    assert len(pipeline.vector_store_manager.embeddings.batches) < len(questions)
+
+
+def test_batch_embeds_whitespace_normalized_questions(pipeline):
+    pipeline.ask("what   is\tmeiosis")
+
+    assert pipeline.vector_store_manager.embeddings.batches == [["what is meiosis"]]
+
+
+def test_repeated_question_is_served_from_cache(pipeline):
+    first = pipeline.ask("What is GV arrest?")
+    second = pipeline.ask("  what is gv ARREST? ")
+
+    assert second is first
+    assert len(pipeline.vector_store_manager.embeddings.batches) == 1
+
+
+def test_llm_error_reaches_every_caller(pipeline):
+    pipeline.llm.error = RuntimeError("rate limited")
+
+    results = _ask_concurrently(pipeline, [f"question {i}" for i in range(4)])
+
+    assert all("rate limited" in result["answer"] for result in results)
+
+
+def test_error_after_retrieval_reaches_every_caller(pipeline, monkeypatch):
+    def broken_format_sources(source_documents):
+        raise TypeError("bad metadata")
+
+    monkeypatch.setattr(pipeline, "format_sources", broken_format_sources)
+
+    results = _ask_concurrently(pipeline, [f"question {i}" for i in range(4)])
+
+    assert all("bad metadata" in result["answer"] for result in results)
+
+
+def test_error_before_llm_reaches_every_caller(pipeline, monkeypatch):
+    def broken_build_prompt(question, source_documents):
+        raise ValueError("prompt too long")
+
+    monkeypatch.setattr(pipeline, "_build_prompt", broken_build_prompt)
+
+    results = _ask_concurrently(pipeline, [f"question {i}" for i in range(4)])
+
+    assert all("prompt too long" in result["answer"] for result in results)
+
+
+def test_ask_times_out_instead_of_blocking(pipeline):
+    pipeline.llm.delay = 5
+    pipeline.timeout = 0.2
+
+    result = pipeline.ask("slow question")
+
+    assert "no answer within" in result["answer"]
+
+
+def test_ask_async_times_out_instead_of_blocking(pipeline):
+    pipeline.llm.delay = 5
+    pipeline.timeout = 0.2
+
+    result = asyncio.run(pipeline.ask_async("slow question"))
+
+    assert "no answer within" in result["answer"]
+
+
+def test_aask_stream_yields_tokens_then_sources(pipeline):
+    async def consume():
+        return [chunk async for chunk in pipeline.aask_stream("stream me")]
+
+    chunks = asyncio.run(consume())
+
+    assert "".join(chunks[:-1]) == "answer: stream me"
+    assert chunks[-1] == {"sources": ["**Title**: Oocyte Maturation"]}
+
+
+def test_aask_stream_cancels_generation_when_consumer_stops(pipeline):
+    pipeline.llm.delay = 0.05
+
+    async def take_first_chunk():
+        stream = pipeline.aask_stream("stream me")
+        first = await stream.__anext__()
+        await stream.aclose()
+        return first
+
+    assert asyncio.run(take_first_chunk()) == "answer"
+    assert pipeline.llm.stream_closed.wait(2)
+    # Abandoned answers are not cached
+    assert pipeline._cache.get(pipeline._cache_key("stream me")) is None
+
+
+def test_close_stops_the_batching_thread(pipeline):
+    pipeline.ask("start the loop")
+    loop, thread = pipeline._loop, pipeline._thread
+
+    pipeline.close()
+
+    assert not thread.is_alive()
+    assert loop.is_closed()
+    assert pipeline.vector_store_manager.closed == ["async", "sync"]
+
+
+def test_close_resolves_questions_in_flight(pipeline):
+    pipeline.llm.delay = 5
+    results = []
+    thread = threading.Thread(target=lambda: results.append(pipeline.ask("slow question")))
+    thread.start()
+    while not pipeline._batch_tasks:
+        threading.Event().wait(0.01)
+
+    pipeline.close()
+    thread.join(2)
+
+    assert not thread.is_alive()
+    assert "error" in results[0]["answer"]
+
+
+def test_closed_pipeline_rejects_new_questions(pipeline):
+    pipeline.close()
+
+    with pytest.raises(RuntimeError):
+        pipeline.ask("too late")
+    with pytest.raises(RuntimeError):
+        pipeline.ask_stream("too late")
+    with pytest.raises(RuntimeError):
+        asyncio.run(pipeline.ask_async("too late"))
+    # close() is idempotent
+    pipeline.close()
+
+
+def test_ask_batch_uses_the_micro_batcher_and_cache(pipeline):
+    cached = pipeline.ask("question 0")
+
+    results = pipeline.ask_batch(["question 0", "question 1", "question 2"])
+
+    assert results[0] is cached
+    assert [result["answer"] for result in results[1:]] == ["answer: question 1", "answer: question 2"]
+    assert pipeline.vector_store_manager.embeddings.batches[1:] == [["question 1", "question 2"]]
+    assert pipeline.ask("question 2") is results[2]
+
+
+def test_ask_batch_reports_errors_per_question(pipeline):
+    pipeline.llm.error = RuntimeError("rate limited")
+
+    results = pipeline.ask_batch(["question 1", "question 2"])
+
+    assert all("rate limited" in result["answer"] for result in results)
+
+
+def test_warmup_starts_the_batching_loop_without_calling_the_llm(pipeline, monkeypatch):
+    monkeypatch.delenv("RAG_WARMUP_LLM", raising=False)
+
+    pipeline.warmup()
+
+    assert pipeline._thread.is_alive()
+    assert pipeline.vector_store_manager.embeddings.async_queries == ["warm up"]
+    assert pipeline.llm.invocations == []
+
+
+def test_warmup_pings_the_llm_when_enabled(pipeline, monkeypatch):
+    monkeypatch.setenv("RAG_WARMUP_LLM", "1")
+
+    pipeline.warmup()
+
+    assert pipeline.llm.invocations == [{"max_tokens": 1}, {"max_tokens": 1}]